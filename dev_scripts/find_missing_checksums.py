@@ -2,37 +2,54 @@
 import os
 import sys
 import logging
-from typing import Union
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Deque, Dict
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
-from ssds import SSDSObjectTag
+from ssds.storage import SSDSObjectTag
 from ssds.deployment import _S3Staging, _GSStaging
 from ssds.blobstore.s3 import S3Blob
-from ssds.blobstore.gs import GSBlob
-from ssds.concurrency import Executor, async_set
+from ssds.blobstore.gs import GSBlobStore
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(stream=sys.stdout)
 logger.level = logging.INFO
-Executor.max_workers = 10
 
-def verify_tags(blob: Union[S3Blob, GSBlob]):
-    tags = blob.get_tags()
-    logger.info(f"checking: {blob.url}")
+MAX_WORKERS = 64
+MAX_IN_FLIGHT = 256  # bound the number of pending futures independent of bucket size
+
+def check_tags(url: str, tags: Dict[str, str]):
+    logger.info(f"checking: {url}")
     for key in (SSDSObjectTag.SSDS_MD5, SSDSObjectTag.SSDS_CRC32C):
         if key not in tags:
-            logger.warning(f"missing {SSDSObjectTag.SSDS_MD5}: {blob.url}")
-
-verify_tag_operations = async_set()
-
-for blob in _GSStaging.blobstore_class(_GSStaging.bucket).list("submissions"):
-    verify_tag_operations.put(verify_tags, blob)
-
-for blob in _S3Staging.blobstore_class(_S3Staging.bucket).list("submissions"):
-    verify_tag_operations.put(verify_tags, blob)
-
-for _ in verify_tag_operations.consume():
-    pass
+            logger.warning(f"missing {key}: {url}")
+
+def verify_tags(blob: S3Blob):
+    check_tags(blob.url, blob.get_tags())
+
+def verify_gs_tags(bucket_name: str):
+    # Listed GS blobs carry their metadata, so get_tags makes no request per object
+    for blob in GSBlobStore(bucket_name).list("submissions"):
+        check_tags(blob.url, blob.get_tags())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report SSDS objects missing checksum tags")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="threads checking S3 tags")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="maximum pending tag checks")
+    args = parser.parse_args()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        gs_verification = executor.submit(verify_gs_tags, _GSStaging.bucket)
+        in_flight: Deque[Future] = deque()
+        for blob in _S3Staging.blobstore_class(_S3Staging.bucket).list("submissions"):
+            if args.max_in_flight <= len(in_flight):
+                in_flight.popleft().result()
+            in_flight.append(executor.submit(verify_tags, blob))
+        while in_flight:
+            in_flight.popleft().result()
+        gs_verification.result()
@@ -1,10 +1,10 @@
 import os
 import json
 import logging
-from typing import Any, Dict, Generator, List, Optional, Tuple, Type
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Type
 
-from ssds import storage, aws, gcp, utils
-from ssds.blobstore import BlobStore
+from ssds import storage, aws, gcp, utils, concurrency
+from ssds.blobstore import BlobStore, BlobNotFoundError
 from ssds.blobstore.s3 import S3Blob, S3BlobStore
 from ssds.blobstore.gs import GSBlob, GSBlobStore
 from ssds.blobstore.local import LocalBlob, LocalBlobStore
@@ -15,6 +15,7 @@ logger = logging.getLogger(__name__)
 MAX_KEY_LENGTH = 1024  # this is the maximum length for S3 and GS object names
 # GS docs: https://cloud.google.com/storage/docs/naming-objects
 # S3 docs: https://docs.aws.amazon.com/AmazonS3/latest/dev/UsingMetadata.html
+SYNC_DRAIN_BATCH_SIZE = 32  # number of sync checks submitted between collecting finished checks
 
 class SSDS:
     blobstore_class: Type[BlobStore]
@@ -30,20 +31,19 @@ class SSDS:
             kwargs['billing_project'] = google_billing_project
         # TODO: figure out how to use type checking on this line
         self.blobstore = self.blobstore_class(self.bucket, **kwargs)  # type: ignore
+        self._submission_names: Dict[str, str] = dict()
+        self._key_prefix = f"{self.prefix}/"
 
     def list(self) -> Generator[Tuple[str, str], None, None]:
-        listing = self.blobstore.list(self.prefix)
-        prev_submission_id = ""
-        for blob in listing:
+        key_prefix_length = len(self._key_prefix)
+        name_delimeter = self._name_delimeter
+        for submission_prefix in self.blobstore.list_prefixes(self._key_prefix):
             try:
-                ssds_key = blob.key.strip(f"{self.prefix}/")
-                submission_id, parts = ssds_key.split(self._name_delimeter, 1)
-                submission_name, _ = parts.split("/", 1)
+                # common prefixes end with exactly one delimiter
+                submission_id, submission_name = submission_prefix[key_prefix_length:-1].split(name_delimeter, 1)
             except ValueError:
                 continue
-            if submission_id != prev_submission_id:
-                yield submission_id, submission_name
-                prev_submission_id = submission_id
+            yield submission_id, submission_name
 
     def __repr__(self) -> str:
         return f"<SSDS {self.__class__.__name__} {self.blobstore_class.schema}{self.bucket}>"
@@ -52,36 +52,43 @@ class SSDS:
         return self.__repr__()
 
     def list_submission(self, submission_id: str) -> Generator[str, None, None]:
-        for blob in self.blobstore.list(f"{self.prefix}/{submission_id}"):
-            ssds_key = blob.key.replace(f"{self.prefix}/", "", 1)
+        key_prefix_length = len(self._key_prefix)
+        for blob in self.blobstore.list(f"{self._key_prefix}{submission_id}"):
+            ssds_key = blob.key[key_prefix_length:]
             yield ssds_key
 
     def get_submission_name(self, submission_id: str) -> Optional[str]:
-        name = None
-        for blob in self.blobstore.list(f"{self.prefix}/{submission_id}"):
-            ssds_key = blob.key.strip(f"{self.prefix}/")
-            _, parts = ssds_key.split(self._name_delimeter, 1)
-            name, _ = parts.split("/", 1)
-            break
-        return name
+        # Submission names cannot change once set, so only names that exist are cached
+        if submission_id not in self._submission_names:
+            submission_pfx = f"{self._key_prefix}{submission_id}{self._name_delimeter}"
+            # Only the first prefix is needed
+            for submission_prefix in self.blobstore.list_prefixes(submission_pfx, page_size=1):
+                self._submission_names[submission_id] = submission_prefix[len(submission_pfx):-1]
+                break
+        return self._submission_names.get(submission_id)
 
     def get_submission_prefix(self, submission_id: str) -> str:
         try:
-            blob = next(self.blobstore.list(f"{self.prefix}/{submission_id}"))
+            blob = next(self.blobstore.list(f"{self._key_prefix}{submission_id}", page_size=1))
         except StopIteration:
             raise ValueError(f'Nothing found for submission ID: {submission_id}')
-        ssds_key = blob.key.strip(f"{self.prefix}/")
+        ssds_key = blob.key[len(self._key_prefix):]
         name, _ = ssds_key.split("/", 1)
-        return f"{self.prefix}/{name}"
+        return f"{self._key_prefix}{name}"
 
     def upload(self,
                src_url: str,
                submission_id: str,
                name: Optional[str]=None,
-               subdir: Optional[str]=None) -> Generator[str, None, None]:
+               subdir: Optional[str]=None,
+               max_rate: Optional[float]=None,
+               verify: bool=False) -> Generator[str, None, None]:
         """
         Upload files from src_url directory and yield ssds_key for each file.
         This returns a generator that must be iterated for uploads to occur.
+        If `max_rate` is provided, no more than `max_rate` uploads are started per second, e.g. to stay under S3
+        request limits for the submission prefix.
+        If `verify` is True, the checksums of each uploaded object are checked against its tags after upload.
         """
         name = self._check_name_exists(submission_id, name)
         assert " " not in name  # TODO: create regex to enforce name format?
@@ -89,32 +96,41 @@ class SSDS:
         pfx, listing = storage.listing_for_url(src_url)
         pfx = pfx.strip("/")
         subdir = f"{subdir.strip('/')}" if subdir else ""
-        with storage.CopyClient() as cc:
-            for src_blob in listing:
-                path = src_blob.key.replace(pfx, subdir, 1)
-                ssds_key = self._compose_ssds_key(submission_id, name, path)
-                dst_blob = self.blobstore.blob(f"{self.prefix}/{ssds_key}")
+        key_prefix_length = len(self._key_prefix)
+        pfx_length = len(pfx)
+        compose_ssds_key = self._ssds_key_composer(submission_id, name)
+        # Uploads are typically many independent small files, so keep more of them in flight than the default
+        rate_limiter = concurrency.RateLimiter(max_rate) if max_rate else None
+        with storage.CopyClient(rate_limiter=rate_limiter,
+                                concurrency=concurrency.MAX_UPLOAD_CONCURRENCY,
+                                verify=verify) as cc:
+            for src_blob in concurrency.prefetch(listing):
+                # listed keys always start with pfx
+                path = subdir + src_blob.key[pfx_length:]
+                ssds_key = compose_ssds_key(path)
+                dst_blob = self.blobstore.blob(f"{self._key_prefix}{ssds_key}")
                 cc.copy_compute_checksums(src_blob, dst_blob)
                 for src_blob, dst_blob, exception in cc.completed():
                     if exception is None:
-                        yield dst_blob.key[len(f"{self.prefix}/"):]
+                        yield dst_blob.key[key_prefix_length:]
         for src_blob, dst_blob, exception in cc.completed():
             if exception is None:
-                yield dst_blob.key[len(f"{self.prefix}/"):]
+                yield dst_blob.key[key_prefix_length:]
         logger.info(f"Completed upload: src_url='{src_url}' "
                     f"submission_id='{submission_id}' "
                     f"name='{name}' "
                     f"subdir='{subdir}'")
 
-    def copy(self, src_url: str, submission_id: str, name: str, submission_path: str):
+    def copy(self, src_url: str, submission_id: str, name: str, submission_path: str, verify: bool=False):
         """
         Copy files from local or cloud locations into the ssds, computing checksums.
+        If `verify` is True, the checksums of the copied object are checked against its tags after the copy.
         """
         name = self._check_name_exists(submission_id, name)
         ssds_key = self._compose_ssds_key(submission_id, name, submission_path)
         src_blob = storage.blob_for_url(src_url)
-        dst_blob = self.blobstore.blob(f"{self.prefix}/{ssds_key}")
-        storage.copy_compute_checksums(src_blob, dst_blob)
+        dst_blob = self.blobstore.blob(f"{self._key_prefix}{ssds_key}")
+        storage.copy_compute_checksums(src_blob, dst_blob, verify=verify)
 
     def _check_name_exists(self, submission_id: str, name: Optional[str]) -> str:
         existing_name = self.get_submission_name(submission_id)
@@ -127,40 +143,88 @@ class SSDS:
         return name
 
     def _compose_ssds_key(self, submission_id: str, submission_name: str, path: str) -> str:
-        ssds_key = f"{submission_id}{self._name_delimeter}{submission_name}/{path.strip('/')}"
-        blobstore_key = f"{self.prefix}/{ssds_key}"
-        if MAX_KEY_LENGTH <= len(blobstore_key):
-            raise ValueError(f"Total key length must not exceed {MAX_KEY_LENGTH} characters {os.linesep}"
-                             f"{blobstore_key} is too long {os.linesep}"
-                             f"Use a shorter submission name")
-        return ssds_key
+        return self._ssds_key_composer(submission_id, submission_name)(path)
+
+    def _ssds_key_composer(self, submission_id: str, submission_name: str) -> Callable[[str], str]:
+        """
+        Return a function composing ssds keys for paths in a submission, for use when composing many keys.
+        """
+        submission_key_prefix = f"{submission_id}{self._name_delimeter}{submission_name}/"
+        max_path_length = MAX_KEY_LENGTH - len(self._key_prefix) - len(submission_key_prefix)
+
+        def compose_ssds_key(path: str) -> str:
+            path = path.strip('/')
+            if max_path_length <= len(path):
+                raise ValueError(f"Total key length must not exceed {MAX_KEY_LENGTH} characters {os.linesep}"
+                                 f"{self._key_prefix}{submission_key_prefix}{path} is too long {os.linesep}"
+                                 f"Use a shorter submission name")
+            return submission_key_prefix + path
+
+        return compose_ssds_key
 
     def compose_blobstore_url(self, ssds_key: str) -> str:
-        return f"{self.blobstore.schema}{self.bucket}/{self.prefix}/{ssds_key}"
+        return f"{self.blobstore.schema}{self.bucket}/{self._key_prefix}{ssds_key}"
 
 def is_synced(src_blob: storage.AnyBlob, dst_blob: storage.AnyBlob) -> bool:
-    if dst_blob.exists():
-        return dst_blob.get_tags() == src_blob.get_tags()
-    else:
-        return False
+    synced, _ = _sync_status(src_blob, dst_blob)
+    return synced
+
+def _sync_status(src_blob: storage.AnyBlob, dst_blob: storage.AnyBlob) -> Tuple[bool, Optional[Dict[str, str]]]:
+    """
+    Return whether `dst_blob` is synced with `src_blob`, along with the tags of `src_blob`, or None if it does not
+    exist. The tags are returned so copies do not need to fetch them again.
+    """
+    # get_tags raises for missing blobs, avoiding a separate existence check
+    try:
+        src_tags = src_blob.get_tags()
+    except BlobNotFoundError:
+        return False, None
+    try:
+        return dst_blob.get_tags() == src_tags, src_tags
+    except BlobNotFoundError:
+        return False, src_tags
+
+def _check_synced(src_blob: storage.AnyBlob,
+                  dst_blob: storage.AnyBlob,
+                  dst_exists: bool=True) -> Tuple[storage.AnyBlob, storage.AnyBlob, bool, Optional[Dict[str, str]]]:
+    if not dst_exists:
+        # No need to fetch any tags, the copy fetches source tags as needed
+        return src_blob, dst_blob, False, None
+    synced, src_tags = _sync_status(src_blob, dst_blob)
+    return src_blob, dst_blob, synced, src_tags
 
 def sync(submission_id: str,
          src: SSDS,
          dst: SSDS,
-         subdir: Optional[str] = None) -> Generator[str, None, None]:
-    with storage.CopyClient() as cc:
+         subdir: Optional[str] = None,
+         verify: bool=False) -> Generator[str, None, None]:
+    with storage.CopyClient(verify=verify) as cc:
         subdir = f"{subdir.strip('/')}" if subdir else ""
         full_prefix = f'{src.get_submission_prefix(submission_id)}/{subdir}'
-        for src_blob in src.blobstore.list(full_prefix):
-            dst_blob = dst.blobstore.blob(src_blob.key)
-            if is_synced(src_blob, dst_blob):
-                logger.info(f"already-synced {src_blob.key} from {src} to {dst}")
-            else:
-                logger.info(f"syncing {src_blob.key} from {src} to {dst}")
-                cc.copy(src_blob, dst_blob)
+        # Sync checks are network bound and independent per key, so run them concurrently. Copies are still
+        # dispatched from this thread since CopyClient is not thread safe.
+        sync_checks = concurrency.async_set(concurrency.MAX_RPC_CONCURRENCY)
+
+        def copy_unsynced(checks) -> Generator[str, None, None]:
+            for src_blob, dst_blob, synced, src_tags in checks:
+                if synced:
+                    logger.info(f"already-synced {src_blob.key} from {src} to {dst}")
+                else:
+                    logger.info(f"syncing {src_blob.key} from {src} to {dst}")
+                    cc.copy(src_blob, dst_blob, src_tags)
             for src_blob, dst_blob, exception in cc.completed():
                 if exception is None:
                     yield dst_blob.key
+
+        # A single listing of the destination avoids requesting tags for keys that have not been synced yet
+        dst_keys = {blob.key for blob in dst.blobstore.list(full_prefix)}
+        # Fetch listing pages in the background while sync checks are dispatched
+        for i, src_blob in enumerate(concurrency.prefetch(src.blobstore.list(full_prefix)), start=1):
+            sync_checks.put(_check_synced, src_blob, dst.blobstore.blob(src_blob.key), src_blob.key in dst_keys)
+            # Scanning for finished checks is linear in the number outstanding, so do it in batches
+            if 0 == i % SYNC_DRAIN_BATCH_SIZE:
+                yield from copy_unsynced(sync_checks.consume_finished())
+        yield from copy_unsynced(sync_checks.consume())
     for src_blob, dst_blob, exception in cc.completed():
         if exception is None:
             yield dst_blob.key
@@ -174,18 +238,17 @@ def release(submission_id: str, src: SSDS, dst: SSDS, transfers: List[Tuple[str,
     # verify transfers
     submission_name = src.get_submission_name(submission_id)
     assert submission_name is not None, f"No submission for {submission_id}"
-    dst_keys = set()
-    src_keys = set()
-    for src_url, dst_url in transfers:
-        src_bucket, src_key = storage.parse_cloud_url(src_url)
-        dst_bucket, dst_key = storage.parse_cloud_url(dst_url)
+    parsed_transfers = [(storage.parse_cloud_url(src_url), storage.parse_cloud_url(dst_url))
+                        for src_url, dst_url in transfers]
+    assert len(transfers) == len({src_key for (_, src_key), _ in parsed_transfers}), \
+        "Duplicate source keys not allowed"
+    assert len(transfers) == len({dst_key for _, (_, dst_key) in parsed_transfers}), \
+        "Duplicate destination keys not allowed"
+    submission_pfx = f"{src._key_prefix}{submission_id}"
+    for (src_bucket, src_key), (dst_bucket, dst_key) in parsed_transfers:
         assert src_bucket == src.bucket, f"Source keys must be from bucket {src.bucket}"
         assert dst_bucket == dst.bucket, f"Destination keys must be from bucket {dst.bucket}"
-        assert src_key not in src_keys, "Duplicate source keys not allowed"
-        assert dst_key not in dst_keys, "Duplicate destination keys not allowed"
-        assert src_key.startswith(f"submissions/{submission_id}"), f"Source keys must be in submission {submission_id}"
-        src_keys.add(src_key)
-        dst_keys.add(dst_key)
+        assert src_key.startswith(submission_pfx), f"Source keys must be in submission {submission_id}"
 
     manifest: Dict[str, Any] = dict(submission_id=submission_id,
                                     src_bucket=src.bucket,
@@ -197,11 +260,18 @@ def release(submission_id: str, src: SSDS, dst: SSDS, transfers: List[Tuple[str,
     # perform transfer and write manifest
     manifest['start_timestamp'] = utils.timestamp_now()
     with storage.CopyClient() as cc:
-        for src_url, dst_url in transfers:
-            src_blob = storage.blob_for_url(src_url)
-            dst_blob = storage.blob_for_url(dst_url)
-            if not is_synced(src_blob, dst_blob):
-                cc.copy(src_blob, dst_blob)
+        sync_checks = concurrency.async_set(concurrency.MAX_RPC_CONCURRENCY)
+
+        def copy_unsynced(checks):
+            for src_blob, dst_blob, synced, src_tags in checks:
+                if not synced:
+                    cc.copy(src_blob, dst_blob, src_tags)
+
+        for i, (src_url, dst_url) in enumerate(transfers, start=1):
+            sync_checks.put(_check_synced, storage.blob_for_url(src_url), storage.blob_for_url(dst_url))
+            if 0 == i % SYNC_DRAIN_BATCH_SIZE:
+                copy_unsynced(sync_checks.consume_finished())
+        copy_unsynced(sync_checks.consume())
     for src_blob, dst_blob, exception in cc.completed():
         if exception is None:
             manifest['transfer_map'].append(dict(src_key=src_blob.key, dst_key=dst_blob.key))
@@ -30,7 +30,10 @@ def get_session():
     return boto3.Session(botocore_session=session)
 
 def _boto_config():
-    return config.Config(max_pool_connections=MAX_RPC_CONCURRENCY + MAX_PASSTHROUGH_CONCURRENCY)
+    # Size the pool to the executor so no thread waits on, or discards, a connection. The "standard" retry mode
+    # backs off on throttling errors, which become more likely with this many concurrent requests.
+    return config.Config(max_pool_connections=MAX_RPC_CONCURRENCY + MAX_PASSTHROUGH_CONCURRENCY,
+                         retries=dict(max_attempts=10, mode="standard"))
 
 @lru_cache()
 def get_identity():
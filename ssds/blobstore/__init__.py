@@ -1,6 +1,6 @@
 from math import ceil
 from collections import namedtuple
-from typing import Any, Dict, Optional, Generator
+from typing import Any, BinaryIO, Dict, Optional, Generator, Union
 
 
 MiB = 1024 ** 2
@@ -14,10 +14,23 @@ MULTIPART_THRESHOLD = AWS_MIN_CHUNK_SIZE + 1
 AWS_MAX_MULTIPART_COUNT = 10000
 """Maximum number of parts allowed in a multipart upload.  This is a limitation imposed by S3."""
 
+LIST_PAGE_SIZE = 1000
+"""Maximum number of keys returned per list request by both S3 and GS."""
+
 class BlobStore:
     schema = ""
 
-    def list(self, prefix: str=""):
+    def list(self, prefix: str="", page_size: int=LIST_PAGE_SIZE):
+        """
+        Yield blobs under `prefix`, requesting up to `page_size` keys per list request.
+        """
+        raise NotImplementedError()
+
+    def list_prefixes(self, prefix: str="", delimiter: str="/", page_size: int=LIST_PAGE_SIZE):
+        """
+        Yield each distinct key prefix under `prefix` ending in `delimiter`, without listing every object.
+        Up to `page_size` keys and prefixes are requested per list request.
+        """
         raise NotImplementedError()
 
     def blob(self, key: str):
@@ -39,7 +52,10 @@ class Blob:
     def get(self) -> bytes:
         raise NotImplementedError()
 
-    def put(self, data: bytes):
+    def put(self, data: Union[bytes, BinaryIO], tags: Optional[Dict[str, str]]=None):
+        """
+        Write `data`, which may be a binary file object read from its current position, and optionally `tags`.
+        """
         raise NotImplementedError()
 
     def delete(self):
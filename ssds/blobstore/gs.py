@@ -1,6 +1,6 @@
 import io
 from math import ceil
-from typing import Dict, Optional, Union, Generator
+from typing import BinaryIO, Dict, Optional, Union, Generator
 
 import gs_chunked_io as gscio
 from google.cloud.storage import Blob as GSNativeBlob, Bucket as GSNativeBucket
@@ -8,7 +8,7 @@ from google.api_core import exceptions as gcp_exceptions
 
 from ssds import gcp, concurrency, utils
 from ssds.blobstore import (BlobStore, Blob, AsyncPartIterator, Part, MultipartWriter, get_s3_multipart_chunk_size,
-                            BlobNotFoundError, BlobStoreUnknownError)
+                            BlobNotFoundError, BlobStoreUnknownError, LIST_PAGE_SIZE)
 
 
 class GSBlobStore(BlobStore):
@@ -18,12 +18,28 @@ class GSBlobStore(BlobStore):
         self.bucket_name = bucket_name
         self.billing_project = gcp.resolve_billing_project(billing_project)
 
-    def list(self, prefix="") -> Generator["GSBlob", None, None]:
+    def list(self, prefix="", page_size: int=LIST_PAGE_SIZE) -> Generator["GSBlob", None, None]:
         kwargs = dict()
         if self.billing_project is not None:
             kwargs['user_project'] = self.billing_project
-        for blob in gcp.storage_client().bucket(self.bucket_name, **kwargs).list_blobs(prefix=prefix):
-            yield GSBlob(self.bucket_name, blob.name, self.billing_project)
+        bucket = gcp.storage_client().bucket(self.bucket_name, **kwargs)
+        for blob in bucket.list_blobs(prefix=prefix, page_size=page_size):
+            gs_blob = GSBlob(self.bucket_name, blob.name, self.billing_project)
+            # Listings include object metadata and size, so keep them to avoid fetching the object again
+            gs_blob._listed_native_blob = blob
+            yield gs_blob
+
+    def list_prefixes(self,
+                      prefix: str="",
+                      delimiter: str="/",
+                      page_size: int=LIST_PAGE_SIZE) -> Generator[str, None, None]:
+        kwargs = dict()
+        if self.billing_project is not None:
+            kwargs['user_project'] = self.billing_project
+        bucket = gcp.storage_client().bucket(self.bucket_name, **kwargs)
+        for page in bucket.list_blobs(prefix=prefix, delimiter=delimiter, page_size=page_size).pages:
+            for common_prefix in sorted(page.prefixes):
+                yield common_prefix
 
     def blob(self, key: str) -> "GSBlob":
         return GSBlob(self.bucket_name, key, self.billing_project)
@@ -49,6 +65,7 @@ class GSBlob(Blob):
         self.key = key
         self.billing_project = gcp.resolve_billing_project(billing_project)
         self._gs_bucket = _get_native_bucket(bucket_name, billing_project)
+        self._listed_native_blob: Optional[GSNativeBlob] = None
 
     @property
     def url(self) -> str:
@@ -59,12 +76,13 @@ class GSBlob(Blob):
 
     @utils.retry(gcp_exceptions.ServiceUnavailable, gcp_exceptions.NotFound)
     def put_tags(self, tags: Dict[str, str]):
+        self._listed_native_blob = None
         blob = self._get_native_blob()
         blob.metadata = tags
         blob.patch()
 
     def get_tags(self) -> Dict[str, str]:
-        blob = self._get_native_blob()
+        blob = self._listed_native_blob or self._get_native_blob()
         if blob.metadata is None:
             return dict()
         else:
@@ -73,11 +91,22 @@ class GSBlob(Blob):
     def get(self) -> bytes:
         return self._get_native_blob().download_as_bytes(checksum=None)
 
-    def put(self, data: bytes):
+    def put(self, data: Union[bytes, BinaryIO], tags: Optional[Dict[str, str]]=None):
+        self._listed_native_blob = None
         blob = self._gs_bucket.blob(self.key)
-        blob.upload_from_file(io.BytesIO(data))
+        if tags:
+            blob.metadata = tags
+        if isinstance(data, bytes):
+            blob.upload_from_file(io.BytesIO(data), size=len(data))
+        else:
+            # Pass the size along so small uploads are not sent as resumable uploads, which take an extra request
+            start = data.tell()
+            size = data.seek(0, io.SEEK_END) - start
+            data.seek(start)
+            blob.upload_from_file(data, size=size)
 
     def delete(self):
+        self._listed_native_blob = None
         self._get_native_blob().delete()
 
     def copy_from_is_multipart(self, src_blob: "GSBlob") -> bool:
@@ -92,6 +121,7 @@ class GSBlob(Blob):
         """
         assert isinstance(src_blob, type(self))
         if self.url != src_blob.url:
+            self._listed_native_blob = None
             if not src_blob._gs_bucket.user_project:
                 # TODO: always use rewrite when it support requester pays buckets
                 dst_gs_blob = self._gs_bucket.blob(self.key)
@@ -115,11 +145,13 @@ class GSBlob(Blob):
         self._get_native_blob().download_to_filename(path)
 
     def exists(self) -> bool:
+        if self._listed_native_blob is not None:
+            return True
         blob = self._gs_bucket.blob(self.key)
         return blob.exists()
 
     def size(self) -> int:
-        return self._get_native_blob().size
+        return (self._listed_native_blob or self._get_native_blob()).size
 
     def cloud_native_checksum(self) -> str:
         return self._get_native_blob().crc32c
@@ -140,9 +172,7 @@ class GSAsyncPartIterator(AsyncPartIterator):
     def __iter__(self) -> Generator[Part, None, None]:
         if 1 == self._number_of_parts:
             # TODO: remove this branch when gs-chunked-io supports zero byte files
-            data = io.BytesIO()
-            self._blob.download_to_file(data)
-            yield Part(0, data.getvalue())
+            yield Part(0, self._blob.download_as_bytes(checksum=None))
         else:
             for chunk_number, data in gscio.for_each_chunk_async(self._blob,
                                                                  concurrency.async_set(),
@@ -2,10 +2,11 @@ import os
 import shutil
 from math import ceil
 from functools import wraps
-from typing import Dict, Generator, Optional
+from typing import BinaryIO, Dict, Generator, Optional, Union
 
+from ssds import concurrency
 from ssds.blobstore import (BlobStore, Blob, AsyncPartIterator, Part, MultipartWriter, get_s3_multipart_chunk_size,
-                            BlobNotFoundError, BlobStoreUnknownError)
+                            BlobNotFoundError, BlobStoreUnknownError, LIST_PAGE_SIZE)
 
 
 def catch_blob_not_found(func):
@@ -21,18 +22,55 @@ class LocalBlobStore(BlobStore):
     def __init__(self, basepath: str):
         self.bucket_name = basepath
 
-    def list(self, prefix: str="") -> Generator["LocalBlob", None, None]:
-        root = os.path.join(self.bucket_name, prefix)
-        if root.endswith(os.path.sep):
-            root = root[:-len(os.path.sep)]
-        for (dirpath, dirnames, filenames) in os.walk(root):
-            for filename in filenames:
-                relpath = os.path.relpath(os.path.join(dirpath, filename), self.bucket_name)
-                yield LocalBlob(self.bucket_name, relpath)
+    def list(self, prefix: str="", page_size: int=LIST_PAGE_SIZE) -> Generator["LocalBlob", None, None]:
+        root = os.path.normpath(os.path.join(self.bucket_name, prefix))
+        basepath = os.path.join(self.bucket_name, "")
+        for path in _walk_files(root):
+            if path.startswith(basepath):
+                relpath = path[len(basepath):]
+            else:
+                relpath = os.path.relpath(path, self.bucket_name)
+            yield LocalBlob(self.bucket_name, relpath)
+
+    def list_prefixes(self,
+                      prefix: str="",
+                      delimiter: str="/",
+                      page_size: int=LIST_PAGE_SIZE) -> Generator[str, None, None]:
+        common_prefixes = set()
+        for blob in self.list(prefix):
+            if blob.key.startswith(prefix) and delimiter in blob.key[len(prefix):]:
+                common_prefix, _ = blob.key[len(prefix):].split(delimiter, 1)
+                common_prefixes.add(f"{prefix}{common_prefix}{delimiter}")
+        for common_prefix in sorted(common_prefixes):
+            yield common_prefix
 
     def blob(self, key: str) -> "LocalBlob":
         return LocalBlob(self.bucket_name, key)
 
+def _walk_files(root: str) -> Generator[str, None, None]:
+    """
+    Yield paths of files under `root`, top down, without following symlinked directories.
+    This matches `os.walk`, without joining paths for each file.
+    """
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        return
+    subdirs = list()
+    with entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            else:
+                yield entry.path
+    for subdir in subdirs:
+        yield from _walk_files(subdir)
+
 class LocalBlob(Blob):
     def __init__(self, basepath: str, relpath: str):
         assert basepath == os.path.abspath(basepath)
@@ -46,6 +84,7 @@ class LocalBlob(Blob):
 
     @catch_blob_not_found
     def get_tags(self) -> Dict[str, str]:
+        os.stat(self._path)  # raise for missing files, consistent with cloud blobs
         return dict()
 
     @catch_blob_not_found
@@ -53,9 +92,12 @@ class LocalBlob(Blob):
         with open(self._path, "rb") as fh:
             return fh.read()
 
-    def put(self, data: bytes):
+    def put(self, data: Union[bytes, BinaryIO], tags: Optional[Dict[str, str]]=None):
         with open(self._path, "wb") as fh:
-            fh.write(data)
+            if isinstance(data, bytes):
+                fh.write(data)
+            else:
+                shutil.copyfileobj(data, fh)
 
     @catch_blob_not_found
     def delete(self):
@@ -102,22 +144,31 @@ class LocalAsyncPartIterator:
             raise BlobNotFoundError(f"Could not find {path}")
         self.chunk_size = get_s3_multipart_chunk_size(self.size)
         self._number_of_parts = ceil(self.size / self.chunk_size) if 0 < self.size else 1
-        self.handle = open(path, "rb")
+        self._fd = os.open(path, os.O_RDONLY)
 
     def __len__(self):
         return self._number_of_parts
 
     def __iter__(self) -> Generator[Part, None, None]:
-        for part_number in range(self._number_of_parts):
-            yield self._get_part(part_number)
+        if 1 == self._number_of_parts:
+            yield self._get_part(0)
+        else:
+            # Positional reads do not share a file offset, so parts can be read concurrently
+            parts = concurrency.async_set()
+            for part_number in range(self._number_of_parts):
+                parts.put(self._get_part, part_number)
+                for part in parts.consume_finished():
+                    yield part
+            for part in parts.consume():
+                yield part
 
     def _get_part(self, part_number: int) -> Part:
-        self.handle.seek(part_number * self.chunk_size)
-        return Part(part_number, self.handle.read(self.chunk_size))
+        return Part(part_number, os.pread(self._fd, self.chunk_size, part_number * self.chunk_size))
 
     def close(self):
-        if hasattr(self, "handle"):
-            self.handle.close()
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+            self._fd = None
 
     def __del__(self):
         self.close()
@@ -1,14 +1,15 @@
 import requests
 from math import ceil
+from urllib.parse import urlencode
 from functools import wraps
 from contextlib import closing
-from typing import Any, List, Dict, Tuple, Union, Generator
+from typing import Any, BinaryIO, List, Dict, Tuple, Union, Generator, Optional
 
 import botocore.exceptions
 
 from ssds import aws, concurrency
 from ssds.blobstore import (BlobStore, Blob, AsyncPartIterator, Part, MultipartWriter, get_s3_multipart_chunk_size,
-                            BlobNotFoundError, BlobStoreUnknownError)
+                            BlobNotFoundError, BlobStoreUnknownError, LIST_PAGE_SIZE)
 
 
 def catch_blob_not_found(func):
@@ -30,9 +31,28 @@ class S3BlobStore(BlobStore):
     def __init__(self, bucket_name: str):
         self.bucket_name = bucket_name
 
-    def list(self, prefix="") -> Generator["S3Blob", None, None]:
-        for item in aws.resource("s3").Bucket(self.bucket_name).objects.filter(Prefix=prefix):
-            yield S3Blob(self.bucket_name, item.key)
+    def list(self, prefix="", page_size: int=LIST_PAGE_SIZE) -> Generator["S3Blob", None, None]:
+        paginator = aws.client("s3").get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name,
+                                       Prefix=prefix,
+                                       PaginationConfig=dict(PageSize=page_size)):
+            for item in page.get('Contents', list()):
+                blob = S3Blob(self.bucket_name, item['Key'])
+                # Listings include object sizes, so keep them to avoid a HEAD request for each blob
+                blob._listed_size = item['Size']
+                yield blob
+
+    def list_prefixes(self,
+                      prefix: str="",
+                      delimiter: str="/",
+                      page_size: int=LIST_PAGE_SIZE) -> Generator[str, None, None]:
+        paginator = aws.client("s3").get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name,
+                                       Prefix=prefix,
+                                       Delimiter=delimiter,
+                                       PaginationConfig=dict(PageSize=page_size)):
+            for common_prefix in page.get('CommonPrefixes', list()):
+                yield common_prefix['Prefix']
 
     def blob(self, key: str) -> "S3Blob":
         return S3Blob(self.bucket_name, key)
@@ -40,8 +60,17 @@ class S3BlobStore(BlobStore):
 class S3Blob(Blob):
     def __init__(self, bucket_name: str, key: str):
         self.bucket_name = bucket_name
-        self._s3_bucket = aws.resource("s3").Bucket(self.bucket_name)
         self.key = key
+        self._listed_size: Optional[int] = None
+        self._s3_bucket_resource: Optional[Any] = None
+
+    @property
+    def _s3_bucket(self):
+        # Building boto3 resources is slow relative to listing, and many blobs never need one, e.g. those only
+        # checked for tags. Create it on first use.
+        if self._s3_bucket_resource is None:
+            self._s3_bucket_resource = aws.resource("s3").Bucket(self.bucket_name)
+        return self._s3_bucket_resource
 
     @property
     def url(self) -> str:
@@ -64,11 +93,16 @@ class S3Blob(Blob):
         with closing(self._s3_bucket.Object(self.key).get()['Body']) as fh:
             return fh.read()
 
-    def put(self, data: bytes):
-        aws.client("s3").put_object(Bucket=self.bucket_name, Key=self.key, Body=data)
+    def put(self, data: Union[bytes, BinaryIO], tags: Optional[Dict[str, str]]=None):
+        kwargs = dict()
+        if tags:
+            kwargs['Tagging'] = urlencode(tags)
+        self._listed_size = None
+        aws.client("s3").put_object(Bucket=self.bucket_name, Key=self.key, Body=data, **kwargs)
 
     @catch_blob_not_found
     def delete(self):
+        self._listed_size = None
         self._s3_bucket.Object(self.key).delete()
 
     def copy_from_is_multipart(self, src_blob: "S3Blob") -> bool:
@@ -81,6 +115,7 @@ class S3Blob(Blob):
         """
         assert isinstance(src_blob, type(self))
         if self.url != src_blob.url:
+            self._listed_size = None
             size = src_blob.size()
             part_size = get_s3_multipart_chunk_size(size)
             if part_size >= size:
@@ -105,6 +140,8 @@ class S3Blob(Blob):
 
     @catch_blob_not_found
     def size(self) -> int:
+        if self._listed_size is not None:
+            return self._listed_size
         blob = self._s3_bucket.Object(self.key)
         return blob.content_length
 
@@ -1,12 +1,24 @@
 import base64
-import typing
-import binascii
-from hashlib import md5
-from typing import Tuple, List, Set, Optional
+import hashlib
+from functools import partial
+from typing import Any, BinaryIO, Tuple, List, Optional
 
 import google_crc32c
 
+try:
+    # MD5 is used for integrity checks only. Declaring so keeps it available on FIPS-enabled OpenSSL builds.
+    hashlib.md5(usedforsecurity=False)  # type: ignore
+    md5 = partial(hashlib.md5, usedforsecurity=False)
+except TypeError:
+    # `usedforsecurity` requires Python 3.9
+    md5 = hashlib.md5  # type: ignore
+
+
+CHUNK_SIZE = 1024 * 1024
+
 class crc32c:
+    # google_crc32c uses SSE4.2/ARMv8 CRC32C instructions via its C extension. It falls back to a much slower pure
+    # Python implementation, with a RuntimeWarning, if the extension is not available.
     def __init__(self, data: Optional[bytes]=None):
         if data is not None:
             self._checksum = google_crc32c.Checksum(data)
@@ -24,9 +36,66 @@ class crc32c:
         # kind of wonky, right?
         return base64.b64encode(self._checksum.digest()).decode("utf-8")
 
-def compute_composite_etag(etags: typing.List[str]) -> str:
-    bin_md5 = b"".join([binascii.unhexlify(etag) for etag in etags])
-    composite_etag = md5(bin_md5).hexdigest() + "-" + str(len(etags))
+def md5_and_crc32c(data: bytes) -> Tuple[Any, crc32c]:
+    # Feed both checksums chunk by chunk so that `data` is streamed from memory once, not once per checksum
+    md5_checksum, crc32c_checksum = md5(), crc32c()
+    for start in range(0, len(data), CHUNK_SIZE):
+        chunk = data[start:start + CHUNK_SIZE]
+        md5_checksum.update(chunk)
+        crc32c_checksum.update(chunk)
+    return md5_checksum, crc32c_checksum
+
+def md5_and_crc32c_file(fileobj: BinaryIO) -> Tuple[Any, crc32c]:
+    # Read `fileobj` chunk by chunk so that memory use does not depend on its size
+    md5_checksum, crc32c_checksum = md5(), crc32c()
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        md5_checksum.update(chunk)
+        crc32c_checksum.update(chunk)
+    return md5_checksum, crc32c_checksum
+
+_CRC32C_POLYNOMIAL = 0x82F63B78  # reversed Castagnoli polynomial
+
+def _crc32c_multmodp(a: int, b: int) -> int:
+    # Multiply polynomials `a` and `b` modulo the crc32c polynomial, in reflected bit order
+    m = 1 << 31
+    p = 0
+    while a:
+        if a & m:
+            p ^= b
+            a ^= m
+        m >>= 1
+        b = (b >> 1) ^ _CRC32C_POLYNOMIAL if b & 1 else b >> 1
+    return p
+
+def _crc32c_x2n_table() -> List[int]:
+    # x^(2^k) modulo the crc32c polynomial for k in 0..31
+    table = [1 << 30]
+    for _ in range(31):
+        table.append(_crc32c_multmodp(table[-1], table[-1]))
+    return table
+
+_CRC32C_X2N_TABLE = _crc32c_x2n_table()
+
+def crc32c_combine(crc_a: int, crc_b: int, length_b: int) -> int:
+    """
+    Return the crc32c of the concatenation of A and B given the crc32c of each, and the length of B in bytes.
+    This follows zlib's crc32_combine.
+    """
+    x2n = 1 << 31  # x^0
+    n, k = length_b, 3  # one byte is x^(2^3)
+    while n:
+        if n & 1:
+            x2n = _crc32c_multmodp(_CRC32C_X2N_TABLE[k & 31], x2n)
+        n >>= 1
+        k += 1
+    return _crc32c_multmodp(x2n, crc_a) ^ crc_b
+
+def compute_composite_etag(digests: bytes) -> str:
+    # `digests` is the concatenation of the binary md5 digest of each part, in part order
+    composite_etag = md5(digests).hexdigest() + "-" + str(len(digests) // md5().digest_size)
     return composite_etag
 
 class UnorderedChecksum:
@@ -41,31 +110,28 @@ class UnorderedChecksum:
 
 class S3EtagUnordered(UnorderedChecksum):
     def __init__(self):
-        self._checksums: List[Tuple[int, str]] = list()
+        # Keep binary part digests, avoiding hex encoding and decoding for each part
+        self._checksums: List[Tuple[int, bytes]] = list()
 
     def update(self, chunk_number: int, data: bytes):
-        self._checksums.append((chunk_number, md5(data).hexdigest()))
+        # Safe to call concurrently: list.append is atomic
+        self._checksums.append((chunk_number, md5(data).digest()))
 
     def hexdigest(self) -> str:
-        return compute_composite_etag([cs[1] for cs in sorted(self._checksums)])
+        return compute_composite_etag(b"".join([cs[1] for cs in sorted(self._checksums)]))
 
 class GScrc32cUnordered(UnorderedChecksum):
     def __init__(self):
-        self._current_chunk_number = 0
-        self._chunks: Set[Tuple[int, bytes]] = set()
-        self._checksum = crc32c()
+        # Keep the crc32c and length of each chunk, combined in chunk order when the digest is requested. This avoids
+        # buffering out of order chunks.
+        self._checksums: List[Tuple[int, int, int]] = list()
 
     def update(self, chunk_number: int, data: bytes):
-        self._chunks.add((chunk_number, data))
-        for number, data in sorted(self._chunks):
-            if number == self._current_chunk_number:
-                self._checksum.update(data)
-                self._chunks.remove((number, data))
-                self._current_chunk_number += 1
-            else:
-                break
+        # Safe to call concurrently: list.append is atomic
+        self._checksums.append((chunk_number, google_crc32c.value(data), len(data)))
 
     def hexdigest(self) -> str:
-        for chunk_number, data in sorted(self._chunks):
-            self._checksum.update(data)
-        return self._checksum.google_storage_crc32c()
+        value = 0
+        for _, chunk_value, length in sorted(self._checksums):
+            value = crc32c_combine(value, chunk_value, length)
+        return base64.b64encode(value.to_bytes(4, "big")).decode("utf-8")
@@ -25,6 +25,8 @@ staging_cli = dispatch.group("staging", help=__doc__, arguments={
     "--submission-id": dict(type=str, required=True, help="Submission id provided for your submission"),
     "--name": dict(type=str, default=None, help="Human readable name of submission. Cannot contain spaces"),
     "--subdir": dict(type=str, default=None, help="destination subdirectory"),
+    "--max-rate": dict(type=float, default=None, help="maximum number of files to start uploading per second"),
+    "--verify": dict(default=False, action="store_true", help="check checksums of objects after copying"),
     "path": dict(type=str, help="Directory containing submission material"),
 })
 def upload(args: argparse.Namespace):
@@ -34,7 +36,12 @@ def upload(args: argparse.Namespace):
     """
     ssds = Staging[args.deployment].ssds
     count = 0
-    for ssds_key in ssds.upload(args.path, args.submission_id, args.name, subdir=args.subdir):
+    for ssds_key in ssds.upload(args.path,
+                                args.submission_id,
+                                args.name,
+                                subdir=args.subdir,
+                                max_rate=args.max_rate,
+                                verify=args.verify):
         count += 1
     if not count:
         raise ValueError(f"No objects found for '{args.path}'")
@@ -43,6 +50,7 @@ def upload(args: argparse.Namespace):
     "--submission-id": dict(type=str, required=True, help="Submission id provided for your submission"),
     "--name": dict(type=str, default=None, help="Human readable name of submission. Cannot contain spaces"),
     "--submission-path": dict(type=str, required=True, help="Path in submission directory, e.g. `my/path/to/foo.bam`"),
+    "--verify": dict(default=False, action="store_true", help="check checksums of objects after copying"),
     "src_url": dict(type=str, help="local path, gs://, or s3://")
 })
 def copy(args: argparse.Namespace):
@@ -50,7 +58,7 @@ def copy(args: argparse.Namespace):
     Copy files from the local filesystem or cloud locations into the SSDS
     """
     ssds = Staging[args.deployment].ssds
-    ssds.copy(args.src_url, args.submission_id, args.name, args.submission_path)
+    ssds.copy(args.src_url, args.submission_id, args.name, args.submission_path, verify=args.verify)
 
 @staging_cli.command("list")
 def list(args: argparse.Namespace):
@@ -76,7 +84,8 @@ def list_submission(args: argparse.Namespace):
 @staging_cli.command("sync", arguments={
     "--dst-deployment": dict(type=str, default="gcp", help="destination deployment"),
     "--submission-id": dict(type=str, required=True, help="id of submission"),
-    "--subdir": dict(type=str, default=None, help="a specific subset of the submission to sync")
+    "--subdir": dict(type=str, default=None, help="a specific subset of the submission to sync"),
+    "--verify": dict(default=False, action="store_true", help="check checksums of objects after copying"),
 })
 def sync_command(args: argparse.Namespace):
     """
@@ -84,7 +93,7 @@ def sync_command(args: argparse.Namespace):
     """
     src = Staging[args.deployment].ssds
     dst = Staging[args.dst_deployment].ssds
-    for _ in ssds.sync(args.submission_id, src, dst, args.subdir):
+    for _ in ssds.sync(args.submission_id, src, dst, args.subdir, verify=args.verify):
         pass
 
 @staging_cli.command("bucket")
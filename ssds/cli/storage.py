@@ -7,6 +7,7 @@ import logging
 import argparse
 
 from ssds import storage
+from ssds.concurrency import RateLimiter
 from ssds.cli import dispatch
 
 
@@ -21,15 +22,20 @@ storage_cli = dispatch.group("storage", help=__doc__)
     "src_url": dict(type=str, help="local path, gs://, or s3://"),
     "dst_url": dict(type=str, help="local path, gs://, or s3://"),
     ("-r", "--recursive"): dict(default=False, action="store_true", help="copy directories recursively"),
+    "--verify": dict(default=False, action="store_true", help="check checksums of objects after copying"),
     "--ignore-missing-checksums": dict(default=False,
                                        action="store_true",
-                                       help="raise errors on missing checksums"),
+                                       help="with --verify, do not warn about objects without checksum tags"),
+    "--max-rate": dict(type=float, default=None, help="maximum number of objects to start copying per second"),
 })
 def cp(args: argparse.Namespace):
     """
     Copy files from the local filesystem or cloud locations into the SSDS
     """
-    with storage.CopyClient(ignore_missing_checksums=args.ignore_missing_checksums) as client:
+    rate_limiter = RateLimiter(args.max_rate) if args.max_rate else None
+    with storage.CopyClient(ignore_missing_checksums=args.ignore_missing_checksums,
+                            rate_limiter=rate_limiter,
+                            verify=args.verify) as client:
         if not args.recursive:
             src_blob = storage.blob_for_url(args.src_url)
             dst_blob = storage.blob_for_url(args.dst_url)
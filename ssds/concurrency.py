@@ -1,11 +1,16 @@
+import time
+import queue
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from typing import Any, Generator, Iterable, Optional
 
 from gs_chunked_io.async_collections import AsyncSet, AsyncQueue
 
 
 MAX_RPC_CONCURRENCY = 30         # Copy operations without passing data through local machine
 MAX_PASSTHROUGH_CONCURRENCY = 4  # Copy operatires requiring passthrough
+MAX_MULTIPART_CONCURRENCY = 2    # Multipart copies, each of which transfers its parts concurrently
+MAX_UPLOAD_CONCURRENCY = 16      # Oneshot copies computing checksums, each holding up to one part in memory
 
 class Executor:
     max_workers = MAX_RPC_CONCURRENCY + MAX_PASSTHROUGH_CONCURRENCY
@@ -27,3 +32,71 @@ def async_set(concurrency: int=MAX_PASSTHROUGH_CONCURRENCY):
 
 def async_queue(concurrency: int=MAX_PASSTHROUGH_CONCURRENCY):
     return AsyncQueue(Executor.get(), concurrency)
+
+def prefetch(iterable: Iterable[Any], maxsize: int=4096) -> Generator[Any, None, None]:
+    """
+    Yield items from `iterable`, which is consumed ahead on a background thread buffering up to `maxsize` items.
+    This hides the latency of paged listings behind the work done for each item.
+    """
+    items: queue.Queue = queue.Queue(maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as exception:
+            put((done, exception))
+
+    # Use a dedicated thread, since the producer may block for a long time and should not occupy an executor worker
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, exception = items.get()
+            if exception is not None:
+                raise exception
+            elif item is done:
+                break
+            yield item
+    finally:
+        stopped.set()
+
+class RateLimiter:
+    """
+    Thread safe token bucket limiting operations to `rate` per second, allowing bursts of up to `burst` operations.
+    Useful for staying under per-prefix request limits, e.g. S3 SlowDown responses above 3500 PUTs/s per prefix.
+    """
+    def __init__(self, rate: float, burst: Optional[int]=None):
+        assert 0 < rate
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until an operation is allowed.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if 1 <= self._tokens:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -5,14 +5,14 @@ import os
 import enum
 import logging
 import traceback
-from typing import Any, Dict, Generator, List, Optional, Set, Tuple, Union, Callable
+from typing import Any, Dict, Generator, List, Optional, Set, Tuple, Type, Union, Callable
 
 from ssds import checksum
 from ssds.blobstore import get_s3_multipart_chunk_size, Blob, BlobNotFoundError
 from ssds.blobstore.s3 import S3BlobStore, S3Blob
 from ssds.blobstore.gs import GSBlobStore, GSBlob
 from ssds.blobstore.local import LocalBlobStore, LocalBlob
-from ssds.concurrency import async_set
+from ssds.concurrency import AsyncSet, Executor, async_set, MAX_MULTIPART_CONCURRENCY, RateLimiter
 
 
 logger = logging.getLogger(__name__)
@@ -32,28 +32,46 @@ class SSDSChecksumStatus(enum.Enum):
     incorrect = enum.auto()
 
 class CopyClient:
-    def __init__(self, ignore_missing_checksums: bool=False):
+    def __init__(self,
+                 ignore_missing_checksums: bool=False,
+                 rate_limiter: Optional[RateLimiter]=None,
+                 concurrency: int=10,
+                 verify: bool=False):
+        """
+        If `verify` is True, checksums of copied objects are compared against their tags after each copy, at the cost
+        of an extra request per copy. Uploads are already checked by S3 and GS against the transferred data.
+        A destination whose checksum does not match is deleted and its copy fails. Missing checksum tags are logged
+        as warnings, unless `ignore_missing_checksums` is True.
+        Copies run on the shared executor and submit nested tasks to it, so `concurrency` must leave workers free.
+        """
+        assert 0 < concurrency < Executor.max_workers - MAX_MULTIPART_CONCURRENCY
         self._ignore_missing_checksums = ignore_missing_checksums
-        self._async_set = async_set(10)
+        self._verify = verify
+        self._rate_limiter = rate_limiter
+        self._async_set = async_set(concurrency)
+        self._multipart_async_set = async_set(MAX_MULTIPART_CONCURRENCY)
         self._completed: Set[Tuple[AnyBlob, AnyBlob, Optional[Exception]]] = set()
 
-    def copy(self, src_blob: AnyBlob, dst_blob: AnyBlob):
+    def copy(self, src_blob: AnyBlob, dst_blob: AnyBlob, src_tags: Optional[Dict[str, str]]=None):
         """
         Copy from `src_blob` to `dst_blob`
         This avoids data passthrough when possible, e.g. S3->S3 or GS->GS. For GS->GS copies, passthrough may be forced
         if the source bucket is requester pays. Checksums are computed for Local->Cloud copies.
+        If the tags of `src_blob` are already known, pass them as `src_tags` to avoid fetching them again.
         """
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
         if src_blob.exists():
             if isinstance(dst_blob, LocalBlob):
                 self._download(src_blob, dst_blob)
             elif isinstance(src_blob, type(dst_blob)):
-                self._copy_intra_cloud(src_blob, dst_blob)
+                self._copy_intra_cloud(src_blob, dst_blob, src_tags)
             else:
                 size = src_blob.size()
                 if size <= get_s3_multipart_chunk_size(size):
-                    self._copy_oneshot(src_blob, dst_blob)
+                    self._copy_oneshot(src_blob, dst_blob, src_tags)
                 else:
-                    self._copy_multipart(src_blob, dst_blob)
+                    self._copy_multipart(src_blob, dst_blob, src_tags)
         else:
             logger.error(f"Failed to copy {src_blob.url} to {dst_blob.url}"
                          f"{os.linesep}Source does not exist!")
@@ -63,11 +81,13 @@ class CopyClient:
         Copy from `src_blob` to `dst_blob`, computing checksums
         This always causes data to pass through the executing instance.
         """
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
         size = src_blob.size()
         if size <= get_s3_multipart_chunk_size(size):
             self._do_copy_async(copy_oneshot_passthrough, src_blob, dst_blob, compute_checksums=True)
         else:
-            self._do_copy(copy_multipart_passthrough, src_blob, dst_blob, compute_checksums=True)
+            self._do_copy_multipart_async(copy_multipart_passthrough, src_blob, dst_blob, compute_checksums=True)
 
     def _download(self, src_blob: AnyBlob, dst_blob: LocalBlob):
         dirname = os.path.dirname(dst_blob.url)
@@ -75,31 +95,37 @@ class CopyClient:
             os.makedirs(dirname, exist_ok=True)
         self._do_copy_async(_copy_to_local, src_blob, dst_blob)
 
-    def _copy_intra_cloud(self, src_blob: AnyBlob, dst_blob: AnyBlob):
+    def _copy_intra_cloud(self, src_blob: AnyBlob, dst_blob: AnyBlob, src_tags: Optional[Dict[str, str]]=None):
         if dst_blob.copy_from_is_multipart(src_blob):  # type: ignore
-            self._do_copy(_copy_intra_cloud, src_blob, dst_blob)
+            self._do_copy_multipart_async(_copy_intra_cloud, src_blob, dst_blob, src_tags=src_tags)
         else:
-            self._do_copy_async(_copy_intra_cloud, src_blob, dst_blob)
+            self._do_copy_async(_copy_intra_cloud, src_blob, dst_blob, src_tags=src_tags)
 
-    def _copy_oneshot(self, src_blob: AnyBlob, dst_blob: CloudBlob):
+    def _copy_oneshot(self, src_blob: AnyBlob, dst_blob: CloudBlob, src_tags: Optional[Dict[str, str]]=None):
         self._do_copy_async(copy_oneshot_passthrough,
                             src_blob,
                             dst_blob,
-                            compute_checksums=isinstance(src_blob, LocalBlob))
+                            compute_checksums=isinstance(src_blob, LocalBlob),
+                            src_tags=src_tags)
 
-    def _copy_multipart(self, src_blob: AnyBlob, dst_blob: CloudBlob):
-        self._do_copy(copy_multipart_passthrough,
-                      src_blob,
-                      dst_blob,
-                      compute_checksums=isinstance(src_blob, LocalBlob))
+    def _copy_multipart(self, src_blob: AnyBlob, dst_blob: CloudBlob, src_tags: Optional[Dict[str, str]]=None):
+        self._do_copy_multipart_async(copy_multipart_passthrough,
+                                      src_blob,
+                                      dst_blob,
+                                      compute_checksums=isinstance(src_blob, LocalBlob),
+                                      src_tags=src_tags)
 
     def _do_copy(self, copy_func: _CopyMethod, src_blob: AnyBlob, dst_blob: AnyBlob, *args, **kwargs):
         try:
             tags = copy_func(src_blob, dst_blob, *args, **kwargs)
             if not isinstance(dst_blob, LocalBlob):
-                tags = tags or src_blob.get_tags()
-                verify_checksums(dst_blob, tags)
-                dst_blob.put_tags(tags)
+                if tags is None:
+                    tags = src_blob.get_tags()
+                # This already runs on an executor worker, so tag inline rather than waiting on a nested task
+                if copy_func not in _tags_on_write_copy_methods:
+                    dst_blob.put_tags(tags)
+                if self._verify:
+                    self._check_checksums(src_blob, dst_blob, tags)
             self._completed.add((src_blob, dst_blob, None))
             logger.info(f"Copied {src_blob.url} to {dst_blob.url}")
         except Exception as exception:
@@ -107,42 +133,58 @@ class CopyClient:
             logger.error(f"Failed to copy {src_blob.url} to {dst_blob.url}"
                          f"{os.linesep}{traceback.format_exc()}")
 
+    def _check_checksums(self, src_blob: AnyBlob, dst_blob: CloudBlob, tags: Dict[str, str]):
+        status, cs_tag = verify_checksums(dst_blob, tags)
+        if SSDSChecksumStatus.incorrect == status:
+            dst_blob.delete()
+            raise ValueError(f"{status.name} {cs_tag} for {src_blob.url} -> {dst_blob.url}")
+        elif SSDSChecksumStatus.missing == status and not self._ignore_missing_checksums:
+            logger.warning(f"{status.name} {cs_tag} for {src_blob.url} -> {dst_blob.url}")
+
     def _do_copy_async(self, copy_func: _CopyMethod, src_blob: AnyBlob, dst_blob: AnyBlob, *args, **kwargs):
+        _discard_finished(self._async_set)
         self._async_set.put(self._do_copy, copy_func, src_blob, dst_blob, *args, **kwargs)
 
+    def _do_copy_multipart_async(self,
+                                 copy_func: _CopyMethod,
+                                 src_blob: AnyBlob,
+                                 dst_blob: AnyBlob,
+                                 *args,
+                                 **kwargs):
+        # Multipart copies already transfer parts concurrently, so keep fewer of them in flight
+        _discard_finished(self._multipart_async_set)
+        self._multipart_async_set.put(self._do_copy, copy_func, src_blob, dst_blob, *args, **kwargs)
+
     def completed(self) -> Generator[Tuple[AnyBlob, AnyBlob, Optional[Exception]], None, None]:
         while self._completed:
             src_blob, dst_blob, exception = self._completed.pop()
             yield src_blob, dst_blob, exception
 
-    def _finalize_copy(self, src_blob: AnyBlob, dst_blob: AnyBlob, tags: Optional[dict]=None):
-        if not isinstance(dst_blob, LocalBlob):
-            tags = tags or src_blob.get_tags()
-            status, cs_tag = verify_checksums(dst_blob, tags)
-            if SSDSChecksumStatus.ok == status:
-                dst_blob.put_tags(tags)
-            elif self._ignore_missing_checksums:
-                logger.warning(f"{status.name} {cs_tag} for {src_blob.url} -> {dst_blob.url}")
-            else:
-                logger.error(f"{status.name} {cs_tag} for {src_blob.url} -> {dst_blob.url}")
-                dst_blob.delete()
-        logger.info(f"Copied {src_blob.url} to {dst_blob.url}")
-
     def __enter__(self):
         return self
 
     def __exit__(self, *args, **kwargs):
         for _ in self._async_set.consume():
             pass
+        for _ in self._multipart_async_set.consume():
+            pass
+
+def _discard_finished(operations: AsyncSet):
+    # Drop finished futures, raising any errors, since results are not needed. Otherwise they accumulate, and each
+    # `put` scans all of them for running operations.
+    for _ in operations.consume_finished():
+        pass
 
 def _copy_to_local(src_blob: AnyBlob, dst_blob: LocalBlob) -> Dict[str, str]:
     src_blob.download(dst_blob.url)
     return dict()  # return empty tags for downloads
 
-def _copy_intra_cloud(src_blob: AnyBlob, dst_blob: AnyBlob) -> Dict[str, str]:
+def _copy_intra_cloud(src_blob: AnyBlob,
+                      dst_blob: AnyBlob,
+                      src_tags: Optional[Dict[str, str]]=None) -> Dict[str, str]:
     assert isinstance(src_blob, type(dst_blob))
     dst_blob.copy_from(src_blob)  # type: ignore
-    return src_blob.get_tags()
+    return src_tags if src_tags is not None else src_blob.get_tags()
 
 _checks = {S3Blob: ("S3 ETag", SSDSObjectTag.SSDS_MD5), GSBlob: ("GS crc32c", SSDSObjectTag.SSDS_CRC32C)}
 def verify_checksums(dst_blob: CloudBlob, checksums: Dict[str, str]) -> Tuple[SSDSChecksumStatus, str]:
@@ -156,55 +198,85 @@ def verify_checksums(dst_blob: CloudBlob, checksums: Dict[str, str]) -> Tuple[SS
 
 def copy_oneshot_passthrough(src_blob: AnyBlob,
                              dst_blob: CloudBlob,
-                             compute_checksums: bool=False) -> Optional[Dict[str, str]]:
+                             compute_checksums: bool=False,
+                             src_tags: Optional[Dict[str, str]]=None) -> Optional[Dict[str, str]]:
     """
     Copy from `src_blob` to `dst_blob`, passing data through the executing instance.
-    Optionally compute checksums.
+    Optionally compute checksums, otherwise `src_tags` are used, fetching them from `src_blob` if not provided.
     """
+    if compute_checksums and isinstance(src_blob, LocalBlob):
+        # Stream local files twice, once for checksums and once for upload, instead of reading them into memory
+        with open(src_blob.url, "rb") as fh:
+            md5_checksum, crc32c_checksum = checksum.md5_and_crc32c_file(fh)
+            tags = {SSDSObjectTag.SSDS_MD5: md5_checksum.hexdigest(),
+                    SSDSObjectTag.SSDS_CRC32C: crc32c_checksum.google_storage_crc32c()}
+            fh.seek(0)
+            dst_blob.put(fh, tags=tags)
+        return tags
     data = src_blob.get()
-    checksums: Optional[dict] = None
     if compute_checksums:
-        checksums = {SSDSObjectTag.SSDS_MD5: checksum.md5(data).hexdigest(),
-                     SSDSObjectTag.SSDS_CRC32C: checksum.crc32c(data).google_storage_crc32c()}
-    dst_blob.put(data)
-    return checksums
+        md5_checksum, crc32c_checksum = checksum.md5_and_crc32c(data)
+        tags = {SSDSObjectTag.SSDS_MD5: md5_checksum.hexdigest(),
+                SSDSObjectTag.SSDS_CRC32C: crc32c_checksum.google_storage_crc32c()}
+    else:
+        tags = src_tags if src_tags is not None else src_blob.get_tags()
+    # Tags are written with the object, saving a separate tagging request
+    dst_blob.put(data, tags=tags)
+    return tags
 
 def copy_multipart_passthrough(src_blob: AnyBlob,
                                dst_blob: CloudBlob,
-                               compute_checksums: bool=False) -> Optional[Dict[str, str]]:
+                               compute_checksums: bool=False,
+                               src_tags: Optional[Dict[str, str]]=None) -> Optional[Dict[str, str]]:
     """
     Copy from `src_blob` to `dst_blob`, passing data through the executing instance.
-    Optionally compute checksums.
+    Optionally compute checksums, otherwise `src_tags` are returned.
     """
     checksums: Optional[dict] = None
+    checksum_updates = dict()
     if compute_checksums:
         checksums = {SSDSObjectTag.SSDS_MD5: checksum.S3EtagUnordered(),
                      SSDSObjectTag.SSDS_CRC32C: checksum.GScrc32cUnordered()}
+        # Update checksums concurrently on workers, overlapping hashing with part transfers. Both checksums are computed
+        # per part and combined in part order at the end.
+        checksum_updates = {key: async_set() for key in checksums}
     with dst_blob.multipart_writer() as writer:
         for part in src_blob.parts():
             if checksums is not None:
-                for cs in checksums.values():
-                    cs.update(part.number, part.data)
+                for key, cs in checksums.items():
+                    checksum_updates[key].put(cs.update, part.number, part.data)
+                    _discard_finished(checksum_updates[key])
             writer.put_part(part)
     if checksums is not None:
+        for updates in checksum_updates.values():
+            for _ in updates.consume():
+                pass
         return {key: cs.hexdigest() for key, cs in checksums.items()}
     else:
-        return None
+        return src_tags
 
-def copy(src_blob: AnyBlob, dst_blob: AnyBlob):
-    with CopyClient() as client:
+_tags_on_write_copy_methods = {copy_oneshot_passthrough}
+
+def copy(src_blob: AnyBlob, dst_blob: AnyBlob, verify: bool=False):
+    with CopyClient(verify=verify) as client:
         client.copy(src_blob, dst_blob)
 
-def copy_compute_checksums(src_blob: AnyBlob, dst_blob: CloudBlob):
-    with CopyClient() as client:
+def copy_compute_checksums(src_blob: AnyBlob, dst_blob: CloudBlob, verify: bool=False):
+    with CopyClient(verify=verify) as client:
         client.copy_compute_checksums(src_blob, dst_blob)
 
 def transform_key(src_key: str, src_pfx: str, dst_pfx: str) -> str:
     dst_key = src_key.replace(src_pfx.strip("/"), dst_pfx.strip("/"), 1)
     return dst_key
 
+# Cloud blobstore and blob classes keyed by url schema, which is always 5 characters
+_cloud_classes: Dict[str, Tuple[Union[Type[S3BlobStore], Type[GSBlobStore]], Union[Type[S3Blob], Type[GSBlob]]]] = {
+    S3BlobStore.schema: (S3BlobStore, S3Blob),
+    GSBlobStore.schema: (GSBlobStore, GSBlob),
+}
+
 def parse_cloud_url(url: str) -> Tuple[str, str]:
-    if url.startswith("s3://") or url.startswith("gs://"):
+    if url[:5] in _cloud_classes:
         bucket_name, key = url[5:].split("/", 1)
         return bucket_name, key
     else:
@@ -213,12 +285,10 @@ def parse_cloud_url(url: str) -> Tuple[str, str]:
 def blob_for_url(url: str) -> AnyBlob:
     assert url
     blob: AnyBlob
-    if url.startswith("s3://"):
+    if url[:5] in _cloud_classes:
+        _, blob_class = _cloud_classes[url[:5]]
         bucket_name, key = parse_cloud_url(url)
-        blob = S3Blob(bucket_name, key)
-    elif url.startswith("gs://"):
-        bucket_name, key = parse_cloud_url(url)
-        blob = GSBlob(bucket_name, key)
+        blob = blob_class(bucket_name, key)
     else:
         blob = LocalBlob("/", os.path.realpath(os.path.normpath(url)))
     return blob
@@ -228,12 +298,10 @@ def blobstore_for_url(url: str) -> Tuple[str, AnyBlobStore]:
     url is expected to be a prefix, NOT a key
     """
     blobstore: AnyBlobStore
-    if url.startswith("s3://"):
-        bucket_name, pfx = parse_cloud_url(url)
-        blobstore = S3BlobStore(bucket_name)
-    elif url.startswith("gs://"):
+    if url[:5] in _cloud_classes:
+        blobstore_class, _ = _cloud_classes[url[:5]]
         bucket_name, pfx = parse_cloud_url(url)
-        blobstore = GSBlobStore(bucket_name)
+        blobstore = blobstore_class(bucket_name)
     else:
         pfx = os.path.realpath(os.path.normpath(url.strip(os.path.sep)))
         blobstore = LocalBlobStore("/")
@@ -246,12 +314,10 @@ def listing_for_url(url: str) -> Tuple[str, Union[Generator[S3Blob, None, None],
     listing: Union[Generator[S3Blob, None, None],
                    Generator[GSBlob, None, None],
                    Generator[LocalBlob, None, None]]
-    if url.startswith("s3://"):
-        bucket_name, pfx = parse_cloud_url(url)
-        listing = S3BlobStore(bucket_name).list(pfx.strip("/"))
-    elif url.startswith("gs://"):
+    if url[:5] in _cloud_classes:
+        blobstore_class, _ = _cloud_classes[url[:5]]
         bucket_name, pfx = parse_cloud_url(url)
-        listing = GSBlobStore(bucket_name).list(pfx.strip("/"))
+        listing = blobstore_class(bucket_name).list(pfx.strip("/"))
     else:
         pfx = os.path.realpath(os.path.normpath(url)).strip("/")
         listing = LocalBlobStore("/").list(pfx)
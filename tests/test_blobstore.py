@@ -50,6 +50,17 @@ class TestBlobStore(infra.SuppressWarningsMixin, unittest.TestCase):
                 with self.assertRaises(BlobNotFoundError):
                     bs.blob(key).get()
 
+    def test_list_prefixes(self):
+        pfx = f"{uuid4()}"
+        keys = [f"{pfx}/a--b/foo", f"{pfx}/a--b/bar/baz", f"{pfx}/c--d/foo", f"{pfx}/e"]
+        for bs in (local_blobstore, s3_blobstore, gs_blobstore):
+            with self.subTest(blobstore=bs):
+                for key in keys:
+                    if isinstance(bs, LocalBlobStore):
+                        os.makedirs(os.path.dirname(bs.blob(key).url), exist_ok=True)
+                    bs.blob(key).put(b"")
+                self.assertEqual([f"{pfx}/a--b/", f"{pfx}/c--d/"], [p for p in bs.list_prefixes(f"{pfx}/")])
+
     def test_copy_from_is_multipart(self):
         oneshot, multipart = test_data.uploaded([local_blobstore, s3_blobstore, gs_blobstore])
         for bs in (local_blobstore, s3_blobstore, gs_blobstore):
@@ -157,6 +168,12 @@ class TestBlobStore(infra.SuppressWarningsMixin, unittest.TestCase):
                 bs.blob(key).put(b"")
                 bs.blob(key).put_tags(tags)
                 self.assertEqual(tags, bs.blob(key).get_tags())
+                bs.blob(key).put(b"", tags=dict(doom="boom"))
+                self.assertEqual(dict(doom="boom"), bs.blob(key).get_tags())
+                listed_blob = next(bs.list(key))
+                self.assertEqual(dict(doom="boom"), listed_blob.get_tags())
+                listed_blob.put_tags(tags)
+                self.assertEqual(tags, listed_blob.get_tags())
                 with self.assertRaises(BlobNotFoundError):
                     bs.blob(f"{uuid4()}").put_tags(tags)
 
@@ -167,6 +184,11 @@ class TestBlobStore(infra.SuppressWarningsMixin, unittest.TestCase):
                 self.assertFalse(bs.blob(key).exists())
                 bs.blob(key).put(b"")
                 self.assertTrue(bs.blob(key).exists())
+                if not isinstance(bs, LocalBlobStore):
+                    [listed_blob] = list(bs.list(key))
+                    self.assertTrue(listed_blob.exists())
+                    listed_blob.delete()
+                    self.assertFalse(listed_blob.exists())
                 if isinstance(bs, LocalBlobStore):
                     with self.assertRaises(ValueError):
                         bs.blob("/").exists()
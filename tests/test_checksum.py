@@ -33,6 +33,25 @@ class TestSSDSChecksum(infra.SuppressWarningsMixin, unittest.TestCase):
             cs.update(data[i:])
             self.assertEqual(expected_crc32c, cs.hexdigest())
 
+    def test_crc32c_implementation(self):
+        import google_crc32c
+        self.assertEqual("c", google_crc32c.implementation)
+
+    def test_md5_and_crc32c(self):
+        for size in (0, 7, ssds.checksum.CHUNK_SIZE, 2 * ssds.checksum.CHUNK_SIZE + 1):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                md5_checksum, crc32c_checksum = ssds.checksum.md5_and_crc32c(data)
+                self.assertEqual(ssds.checksum.md5(data).hexdigest(), md5_checksum.hexdigest())
+                self.assertEqual(ssds.checksum.crc32c(data).hexdigest(), crc32c_checksum.hexdigest())
+
+    def test_md5_and_crc32c_file(self):
+        data = os.urandom(2 * ssds.checksum.CHUNK_SIZE + 1)
+        with io.BytesIO(data) as fh:
+            md5_checksum, crc32c_checksum = ssds.checksum.md5_and_crc32c_file(fh)
+        self.assertEqual(ssds.checksum.md5(data).hexdigest(), md5_checksum.hexdigest())
+        self.assertEqual(ssds.checksum.crc32c(data).hexdigest(), crc32c_checksum.hexdigest())
+
     def test_blob_crc32c(self):
         data = test_data.oneshot
         blob = storage.Client().bucket(gs_test_bucket).blob("test")
@@ -54,7 +73,7 @@ class TestSSDSChecksum(infra.SuppressWarningsMixin, unittest.TestCase):
         checksums = set()
         chunks = [(i, os.urandom(10)) for i in range(20)]
         expected_checksum = ssds.checksum.compute_composite_etag(
-            [ssds.checksum.md5(c[1]).hexdigest() for c in chunks]
+            b"".join([ssds.checksum.md5(c[1]).digest() for c in chunks])
         )
         for _ in range(10):
             shuffle(chunks)
@@ -78,5 +97,13 @@ class TestSSDSChecksum(infra.SuppressWarningsMixin, unittest.TestCase):
         self.assertEqual(1, len(checksums))
         self.assertEqual(expected_checksum, checksums.pop())
 
+    def test_crc32c_combine(self):
+        for len_a, len_b in [(0, 0), (0, 11), (7, 0), (13, 1024 * 1024 + 3)]:
+            with self.subTest(len_a=len_a, len_b=len_b):
+                a, b = os.urandom(len_a), os.urandom(len_b)
+                crc_a, crc_b = [int(ssds.checksum.crc32c(d).hexdigest(), 16) for d in (a, b)]
+                expected = int(ssds.checksum.crc32c(a + b).hexdigest(), 16)
+                self.assertEqual(expected, ssds.checksum.crc32c_combine(crc_a, crc_b, len_b))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
+sys.path.insert(0, pkg_root)  # noqa
+
+from ssds import concurrency
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_rate_limiter(self):
+        rate, burst, number_of_operations = 50.0, 5, 30
+        limiter = concurrency.RateLimiter(rate, burst)
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as e:
+            for _ in e.map(lambda _: limiter.acquire(), range(number_of_operations)):
+                pass
+        duration = time.monotonic() - start_time
+        self.assertGreaterEqual(duration, (number_of_operations - burst) / rate * 0.9)
+
+    def test_prefetch(self):
+        self.assertEqual(list(range(100)), list(concurrency.prefetch(range(100), maxsize=7)))
+
+        def failing_listing():
+            yield 1
+            raise ValueError("listing failed")
+
+        with self.assertRaises(ValueError):
+            list(concurrency.prefetch(failing_listing()))
+
+if __name__ == '__main__':
+    unittest.main()
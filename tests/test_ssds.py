@@ -255,6 +255,31 @@ class TestSSDS(infra.SuppressWarningsMixin, unittest.TestCase):
 
 class NoFixturesTests(unittest.TestCase):
 
+    def test_list(self):
+        submission_prefixes = ["submissions/foo--bar/", "submissions/no_delimiter/", "submissions/doom--gloom--boom/"]
+        with unittest.mock.patch.object(S3_SSDS.blobstore, 'list_prefixes', return_value=submission_prefixes):
+            submissions = [s for s in S3_SSDS.list()]
+        self.assertEqual([("foo", "bar"), ("doom", "gloom--boom")], submissions)
+
+    def test_get_submission_name(self):
+        ds = _S3StagingTest()
+        with unittest.mock.patch.object(ds.blobstore, 'list_prefixes') as mock_list_prefixes:
+            mock_list_prefixes.return_value = iter(["submissions/foo--bar/"])
+            self.assertEqual("bar", ds.get_submission_name("foo"))
+            self.assertEqual("bar", ds.get_submission_name("foo"))
+            mock_list_prefixes.assert_called_once_with("submissions/foo--", page_size=1)
+            mock_list_prefixes.return_value = iter([])
+            self.assertIsNone(ds.get_submission_name("doom"))
+
+    def test_is_synced(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            bs = LocalBlobStore(dirname)
+            src_blob, dst_blob = bs.blob("src"), bs.blob("dst")
+            src_blob.put(b"data")
+            self.assertFalse(ssds.is_synced(src_blob, dst_blob))
+            dst_blob.put(b"data")
+            self.assertTrue(ssds.is_synced(src_blob, dst_blob))
+
     def test_get_full_prefix(self):
         with unittest.mock.patch.object(S3_SSDS.blobstore, 'list') as mock_list:
             mock_list.return_value.__next__.return_value = S3Blob(
@@ -266,6 +291,17 @@ class NoFixturesTests(unittest.TestCase):
         expected = 'submissions/dc4385e0-0553-4a8b-b000-9542b7d990c3--this_is_a_test_submission_for_sync'
         self.assertEqual(expected, full_prefix)
 
+    def test_get_full_prefix_leading_prefix_characters(self):
+        # Submission ids may start with characters that also appear in the "submissions/" prefix
+        with unittest.mock.patch.object(S3_SSDS.blobstore, 'list') as mock_list:
+            mock_list.return_value.__next__.return_value = S3Blob(
+                bucket_name=_S3StagingTest.bucket,
+                key='submissions/b4385e0-0553-4a8b-b000-9542b7d990c3--submission_name/foo/bar/bert.dat'
+            )
+            full_prefix = S3_SSDS.get_submission_prefix('b4385e0')
+        expected = 'submissions/b4385e0-0553-4a8b-b000-9542b7d990c3--submission_name'
+        self.assertEqual(expected, full_prefix)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,7 @@ import time
 import gzip
 import logging
 import tempfile
+import threading
 import unittest
 from unittest import mock
 from uuid import uuid4
@@ -16,7 +17,8 @@ from typing import Tuple, Optional
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
-from ssds import storage, checksum
+from ssds import storage, checksum, concurrency
+from ssds.blobstore import Part
 from ssds.blobstore.s3 import S3BlobStore, S3Blob
 from ssds.blobstore.gs import GSBlobStore, GSBlob
 from ssds.blobstore.local import LocalBlobStore, LocalBlob
@@ -130,6 +132,69 @@ class TestStorage(infra.SuppressWarningsMixin, unittest.TestCase):
             with self.assertRaises(KeyError):
                 storage.verify_checksums(dst_blob, {})
 
+    def test_copy_client_verify(self):
+        tags = {storage.SSDSObjectTag.SSDS_MD5: "correct"}
+        for verify, copy_tags, native_checksum, expect_failure in [(False, tags, "wrong", False),
+                                                                   (True, tags, "correct", False),
+                                                                   (True, dict(), "missing", False),
+                                                                   (True, tags, "wrong", True)]:
+            with self.subTest(verify=verify, copy_tags=copy_tags, native_checksum=native_checksum):
+                src_blob, dst_blob = mock.MagicMock(), mock.MagicMock(spec=S3Blob)
+                dst_blob.cloud_native_checksum = mock.MagicMock(return_value=native_checksum)
+                with storage.CopyClient(verify=verify) as client:
+                    client._do_copy(mock.MagicMock(return_value=copy_tags), src_blob, dst_blob)
+                [(_, _, exception)] = list(client.completed())
+                self.assertEqual(expect_failure, exception is not None)
+                self.assertEqual(expect_failure, dst_blob.delete.called)
+                self.assertEqual(verify, dst_blob.cloud_native_checksum.called)
+                dst_blob.put_tags.assert_called_once_with(copy_tags)
+
+    def test_copy_client_tags_inline(self):
+        # Copies already occupy executor workers, so tagging must not wait on a further executor task
+        tags = {storage.SSDSObjectTag.SSDS_MD5: "correct"}
+        copy_threads, tag_threads = list(), list()
+
+        def copy_func(src_blob, dst_blob):
+            copy_threads.append(threading.current_thread())
+            return tags
+
+        dst_blob = mock.MagicMock(spec=S3Blob)
+        dst_blob.put_tags.side_effect = lambda tags: tag_threads.append(threading.current_thread())
+        with storage.CopyClient() as client:
+            client._do_copy_async(copy_func, mock.MagicMock(), dst_blob)
+        [(_, _, exception)] = list(client.completed())
+        self.assertIsNone(exception)
+        self.assertEqual(copy_threads, tag_threads)
+
+    def test_copy_client_concurrency(self):
+        storage.CopyClient(concurrency=concurrency.MAX_UPLOAD_CONCURRENCY)
+        with self.assertRaises(AssertionError):
+            storage.CopyClient(concurrency=concurrency.Executor.max_workers)
+
+    def test_copy_multipart_passthrough_many_parts(self):
+        parts = [Part(number=i, data=os.urandom(16)) for i in range(2000)]
+        src_blob, dst_blob = mock.MagicMock(), mock.MagicMock(spec=S3Blob)
+        src_blob.parts.return_value = iter(parts)
+        expected_checksums = {storage.SSDSObjectTag.SSDS_MD5: checksum.S3EtagUnordered(),
+                              storage.SSDSObjectTag.SSDS_CRC32C: checksum.GScrc32cUnordered()}
+        for part in parts:
+            for cs in expected_checksums.values():
+                cs.update(part.number, part.data)
+
+        # Record how many futures each checksum update set holds when a part is dispatched
+        retained = list()
+        put = concurrency.AsyncSet.put
+
+        def recording_put(async_set, *args, **kwargs):
+            retained.append(len(async_set))
+            put(async_set, *args, **kwargs)
+
+        with mock.patch.object(concurrency.AsyncSet, "put", recording_put):
+            tags = storage.copy_multipart_passthrough(src_blob, dst_blob, compute_checksums=True)
+        self.assertEqual({key: cs.hexdigest() for key, cs in expected_checksums.items()}, tags)
+        self.assertEqual(len(parts), dst_blob.multipart_writer().__enter__().put_part.call_count)
+        self.assertLessEqual(max(retained), concurrency.MAX_PASSTHROUGH_CONCURRENCY)
+
     def test_transform_key(self):
         src_key = "some/key/or/other/to/what.txt"
         src_pfx = "/some/key/"